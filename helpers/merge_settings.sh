@@ -19,6 +19,34 @@ set -euo pipefail
 # Navigate to the Claude directory
 cd "$HOME/.claude"
 
+# Replaced after every successful run; delete it to force a merge
+stamp_file=".cache/merge_settings.stamp"
+
+# Touched once settings.json is in its final state, to spot later hand edits
+output_stamp_file=".cache/merge_settings.output.stamp"
+
+# ---------------------------------------------------------------------------- #
+#                             0. SKIP IF UP TO DATE                            #
+# ---------------------------------------------------------------------------- #
+
+# Skip the merge (and its Bun spawn) when nothing changed since the last run:
+# no settings source or this script since the run started, and not settings.json
+# since the run wrote it. Adding or removing a source file bumps its directory's
+# mtime, so find catches that too
+if [ -f settings.json ] && [ -f "$stamp_file" ] && [ -f "$output_stamp_file" ] &&
+    [ -z "$(find settings helpers/merge_settings.sh -newer "$stamp_file" -print -quit)" ] &&
+    [ -z "$(find settings.json -newer "$output_stamp_file" -print -quit)" ]; then
+    echo "✓ settings.json already up to date"
+    exit 0
+fi
+
+# Mark the start of this run before any source is read; it becomes the stamp
+# only on success, so an edit made while the merge runs is still newer than it
+mkdir -p "$(dirname "$stamp_file")"
+stamp_next=$(mktemp "$stamp_file.XXXXXX")
+tmp_file=""
+trap 'rm -f "$stamp_next" ${tmp_file:+"$tmp_file"}' EXIT
+
 # ---------------------------------------------------------------------------- #
 #                              1. DISCOVER FILES                               #
 # ---------------------------------------------------------------------------- #
@@ -89,7 +117,26 @@ merged_json=$(echo "$parsed_json" | jq -s '
 #                              4. WRITE OUTPUT                                 #
 # ---------------------------------------------------------------------------- #
 
-# Write the merged JSON to settings.json
-echo "$merged_json" > settings.json
+# Skip the write when the merged output is unchanged, so settings.json keeps its
+# mtime and Claude Code doesn't pick up a spurious settings change
+if [ -f settings.json ] && [ "$merged_json" = "$(cat settings.json)" ]; then
+    echo "✓ settings.json already up to date"
+else
+    # Write the merged JSON to a temp file next to settings.json and rename it
+    # into place, so Claude Code never reads a partially written file
+    tmp_file=$(mktemp settings.json.XXXXXX)
+    # Keep the existing file's mode (settings.json can hold env secrets); a new
+    # file gets the umask default instead of mktemp's 600
+    if [ -f settings.json ]; then
+        cp -p settings.json "$tmp_file"
+    else
+        chmod "$(printf '%o' $((0666 & ~0$(umask))))" "$tmp_file"
+    fi
+    echo "$merged_json" > "$tmp_file"
+    mv -f "$tmp_file" settings.json
+    echo "✓ Merged settings.json from JSONC files"
+fi
 
-echo "✓ Merged settings.json from JSONC files"
+# Record the successful run for the up-to-date check in section 0
+touch "$output_stamp_file"
+mv -f "$stamp_next" "$stamp_file"
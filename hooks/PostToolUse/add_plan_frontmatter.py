@@ -10,20 +10,71 @@ See https://github.com/anthropics/claude-code/issues/12378
 
 # ruff: noqa: D103
 
+import functools
 import json
-import subprocess
+import os
 import sys
-from datetime import datetime, timezone
+import time
 from pathlib import Path
 
-# Cache for git branch (unlikely to change during session)
-_git_branch_cache: dict[str, str] = {}
+# Symbolic ref prefix in .git/HEAD when a branch is checked out
+HEAD_REF_PREFIX = "ref: refs/heads/"
 
+# Placeholder branch that reftable repositories keep in .git/HEAD
+REFTABLE_STUB_BRANCH = ".invalid"
 
+# Path fragment every plan file path contains, checked before any Path work
+PLANS_SEGMENT = ".claude/plans/"
+
+# Block size for streaming the original plan behind the frontmatter
+COPY_CHUNK_BYTES = 64 * 1024
+
+# Single-pass escape table for double-quoted YAML values
+YAML_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"'})
+
+
+def read_head_branch(cwd: str) -> str | None:
+    """Read the current branch straight from HEAD, without spawning git.
+
+    Walks up from cwd to the nearest .git, following the "gitdir:" pointer file
+    used by worktrees and submodules.
+
+    Args:
+        cwd: Directory inside the git repository
+
+    Returns:
+        Branch name, empty string if HEAD is detached or cwd is not in a repo,
+        or None if HEAD is a reftable stub or can't be read directly
+    """
+    for directory in (Path(cwd), *Path(cwd).parents):
+        dot_git = directory / ".git"
+        try:
+            if dot_git.is_dir():
+                head = (dot_git / "HEAD").read_text()
+            elif dot_git.is_file():
+                gitdir = dot_git.read_text().removeprefix("gitdir:").strip()
+                head = (directory / gitdir / "HEAD").read_text()
+            else:
+                continue
+        except OSError:
+            return None
+
+        if head.startswith(HEAD_REF_PREFIX):
+            branch = head[len(HEAD_REF_PREFIX) :].strip()
+            # Reftable repos keep the real HEAD in the reftable; let git resolve it
+            return None if branch == REFTABLE_STUB_BRANCH else branch
+        return ""  # Detached HEAD, which git also reports as no branch
+
+    return ""
+
+
+@functools.lru_cache(maxsize=32)
 def get_git_branch(cwd: str) -> str:
     """Get current git branch, or empty string if not in repo.
 
-    Uses a cache since branch is unlikely to change during a session.
+    Reads HEAD directly when possible and only falls back to git for reftable
+    repositories and unreadable layouts. Cached per cwd since branch is unlikely
+    to change during a session.
 
     Args:
         cwd: Directory to check for git repository
@@ -34,33 +85,48 @@ def get_git_branch(cwd: str) -> str:
     if not cwd:
         return ""
 
-    if cwd in _git_branch_cache:
-        return _git_branch_cache[cwd]
+    branch = read_head_branch(cwd)
+    if branch is not None:
+        return branch
+
+    # Imported lazily: most invocations exit before needing git
+    import subprocess
 
     try:
         result = subprocess.run(
             ["git", "branch", "--show-current"],
             cwd=cwd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             text=True,
             timeout=5,
         )
-        branch = result.stdout.strip() if result.returncode == 0 else ""
-        _git_branch_cache[cwd] = branch
-        return branch
+        return result.stdout.strip() if result.returncode == 0 else ""
     except (subprocess.TimeoutExpired, subprocess.SubprocessError, OSError):
-        _git_branch_cache[cwd] = ""
         return ""
 
 
+@functools.lru_cache(maxsize=1)
+def _home_prefix() -> str:
+    """Return the home directory with a trailing slash, resolved once per process."""
+    return str(Path.home()) + "/"
+
+
 def to_tilde_path(path: str) -> str:
     """Convert absolute path to ~-prefixed path if under home directory."""
-    home = str(Path.home())
-    if path.startswith(home):
-        return "~" + path[len(home) :]
+    prefix = _home_prefix()
+    if path.startswith(prefix):
+        return "~/" + path[len(prefix) :]
+    if path == prefix[:-1]:
+        return "~"
     return path
 
 
+def _yaml_escape(value: str) -> str:
+    """Escape backslashes and quotes for a double-quoted YAML scalar."""
+    return value.translate(YAML_ESCAPES)
+
+
 def build_frontmatter(data: dict, plan_path: str) -> str:
     """Build YAML frontmatter string with metadata.
 
@@ -76,30 +142,24 @@ def build_frontmatter(data: dict, plan_path: str) -> str:
     # All values are quoted for YAML safety (paths with spaces, special chars)
     # Fields ordered alphabetically
     fields = [
-        ("created", datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")),
+        ("created", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())),
         ("git_branch", get_git_branch(cwd)),
         ("plan_path", to_tilde_path(plan_path)),
         ("project_directory", to_tilde_path(cwd)),
         ("session_id", data.get("session_id", "unknown")),
     ]
 
-    lines = ["---"]
-    for key, value in fields:
-        if value:  # Skip empty values
-            # Escape backslashes and quotes for YAML safety
-            escaped = value.replace("\\", "\\\\").replace('"', '\\"')
-            lines.append(f'{key}: "{escaped}"')
-    lines.append("---")
-
-    return "\n".join(lines)
+    # Skip empty values
+    body = "\n".join(f'{key}: "{_yaml_escape(value)}"' for key, value in fields if value)
+    return f"---\n{body}\n---"
 
 
 def main() -> None:
     """Main hook entry point."""
-    # Parse stdin JSON
+    # Parse stdin JSON from a single bytes read, skipping the text decoding layer
     try:
-        data = json.load(sys.stdin)
-    except json.JSONDecodeError:
+        data = json.loads(sys.stdin.buffer.read())
+    except (json.JSONDecodeError, UnicodeDecodeError):
         sys.exit(0)  # Invalid input, don't break hook chain
 
     # Only process Write tool
@@ -111,6 +171,10 @@ def main() -> None:
     if not file_path_str:
         sys.exit(0)
 
+    # Cheap string prefilter so ordinary writes skip path resolution entirely
+    if not file_path_str.endswith(".md") or PLANS_SEGMENT not in file_path_str:
+        sys.exit(0)
+
     # Check if file is a .md in a .claude/plans/ directory (any location)
     try:
         file_path = Path(file_path_str).resolve()
@@ -128,22 +192,44 @@ def main() -> None:
     except (ValueError, TypeError, OSError):
         sys.exit(0)
 
-    # Read file content
     try:
-        content = file_path.read_text()
-    except (OSError, IOError):
+        src = file_path.open("rb")
+    except OSError:
         sys.exit(0)  # Can't read file
 
-    # Skip if frontmatter already exists (idempotent)
-    if content.startswith("---"):
-        sys.exit(0)
-
-    # Build and prepend frontmatter
-    frontmatter = build_frontmatter(data, file_path_str)
-
+    # Stream frontmatter plus the original bytes into a sibling temp file, then
+    # swap it in, so the plan is never held in memory or left half-written
+    tmp_path = None
     try:
-        file_path.write_text(f"{frontmatter}\n{content}")
-    except (OSError, IOError) as e:
+        with src:
+            # Skip if frontmatter already exists (idempotent)
+            if src.read(3) == b"---":
+                sys.exit(0)
+            src.seek(0)
+
+            frontmatter = build_frontmatter(data, file_path_str)
+
+            # Imported lazily: most invocations exit before writing anything
+            import shutil
+            import tempfile
+
+            # Unique per run, so overlapping runs on one plan never share a temp file
+            fd, tmp_name = tempfile.mkstemp(
+                dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp"
+            )
+            tmp_path = Path(tmp_name)
+            with os.fdopen(fd, "wb") as dst:
+                dst.write(f"{frontmatter}\n".encode())
+                shutil.copyfileobj(src, dst, COPY_CHUNK_BYTES)
+                # Make the data durable before the rename publishes it
+                dst.flush()
+                os.fsync(dst.fileno())
+
+        shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except OSError as e:
+        if tmp_path is not None:
+            tmp_path.unlink(missing_ok=True)
         print(f"Warning: Failed to add frontmatter: {e}", file=sys.stderr)
 
     sys.exit(0)
@@ -61,6 +61,8 @@ BLANK_LINES_RE = re.compile(r"\n{3,}")
 TERMINAL_ESCAPE_RE = re.compile(r"\x1b(?:\][^\x07\x1b]*(?:\x07|\x1b\\)|\[[0-?]*[ -/]*[@-~]|[@-_])")
 CONTROL_CHARACTER_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
 
+# Whitespace runs in a metadata value, folded to a single dash.
+WHITESPACE_RE = re.compile(r"\s+")
 # Characters not allowed in a compact metadata value (stripped from the prefix).
 METADATA_VALUE_RE = re.compile(r"[^A-Za-z0-9._/@:-]+")
 # Leading 8 hex digits of a UUID-like id (e.g. a session_id), used as a short id.
@@ -156,7 +158,7 @@ def _first_string(data: dict[str, Any], keys: tuple[str, ...]) -> str:
 
 def _safe_metadata_value(value: str, max_chars: int) -> str:
     """Normalize a metadata value for a compact bracketed prefix."""
-    text = re.sub(r"\s+", "-", value.strip())
+    text = WHITESPACE_RE.sub("-", value.strip())
     text = METADATA_VALUE_RE.sub("", text)
     return text[:max_chars].strip("-")
 
@@ -311,16 +313,18 @@ def main() -> None:
     if not text:
         sys.exit(0)  # Nothing meaningful; don't clobber the clipboard.
 
-    # capture_output keeps pbcopy's stdout/stderr off our stdout — hook stdout is
-    # injected into the model context, so it must stay empty. encoding is pinned
-    # to UTF-8 so non-ASCII prompts can't raise UnicodeEncodeError when the hook
-    # shell lacks a UTF-8 locale.
+    # pbcopy's stdout goes to DEVNULL and its stderr to a pipe (read only for the
+    # warning below), keeping both off our stdout — hook stdout is injected into
+    # the model context, so it must stay empty. encoding is pinned to UTF-8 so
+    # non-ASCII prompts can't raise UnicodeEncodeError when the hook shell lacks
+    # a UTF-8 locale.
     try:
         result = subprocess.run(
             [PBCOPY],
             input=text,
             encoding="utf-8",
-            capture_output=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
             timeout=5,
         )
     except (OSError, subprocess.SubprocessError) as e:
@@ -2,6 +2,7 @@
 """Unit tests for copy_prompt_to_clipboard.py hook."""
 
 import json
+import subprocess
 from io import StringIO
 from unittest.mock import MagicMock, patch
 
@@ -245,6 +246,7 @@ class TestMain:
         mock_run.assert_called_once()
         assert mock_run.call_args.args[0] == [hook.PBCOPY]
         assert mock_run.call_args.kwargs["input"] == f"[repo:demo session:00893aaf]\n{LONG_PROMPT}"
+        assert mock_run.call_args.kwargs["stdout"] == subprocess.DEVNULL
 
     @patch("subprocess.run")
     @patch("sys.stdin", new_callable=StringIO)